@@ -1,6 +1,4 @@
-#!/usr/bin/python
-
-from __future__ import print_function
+#!/usr/bin/env python3
 
 """
 This script reads in the profile-raw file generated by Glulxe profiling,
@@ -36,7 +34,7 @@ To sum up, in command-line form:
 
 % inform -G -k game.inf
 % glulxe --profile profile-raw game.ulx
-% python profile-analyze.py profile-raw gameinfo.dbg --glk dispatch_dump.xml
+% python3 profile-analyze.py profile-raw gameinfo.dbg --glk dispatch_dump.xml
 
 You can replace the debug output with the assembly output of the Inform
 compiler, which you get with the -a switch. Save the output and use it
@@ -44,7 +42,7 @@ instead of the debug file:
 
 % inform -G -a game.inf > game.asm
 % glulxe --profile profile-raw game.ulx
-% python profile-analyze.py profile-raw game.asm --glk dispatch_dump.xml
+% python3 profile-analyze.py profile-raw game.asm --glk dispatch_dump.xml
 
 * The output:
 
@@ -84,7 +82,7 @@ a particular function is being called from).
 You can explore the profiling data in more detail by running the script
 interactively:
 
-% python -i profile-analyze.py profile-raw game.asm --glk dispatch_dump.xml
+% python3 -i profile-analyze.py profile-raw game.asm --glk dispatch_dump.xml
 
 After it runs, you'll be left at a Python prompt. You might want to list
 functions sorted in other ways:
@@ -170,7 +168,7 @@ by the entire program; its max_depth is zero.
 If you just want to browse an Inform debug file, and bypass all the
 profiling stuff, just do:
 
-# python -i profile-analyze.py -d gameinfo.dbg
+# python3 -i profile-analyze.py -d gameinfo.dbg
 
 This will leave you at a Python prompt. The global "debugfile" contains
 the parsed debug information, which you can browse:
@@ -184,9 +182,25 @@ the parsed debug information, which you can browse:
 import sys, os.path
 import optparse
 import io
+import heapq
+import operator
+import re
+import mmap
+import struct
 import xml.sax
-from struct import unpack
-from chunk import Chunk
+import xml.parsers.expat
+
+# Precompiled unpackers for big-endian binary fields (in the old-style
+# debug file and in Blorb chunk headers). These are bound unpack_from
+# methods, so a call does no format parsing or attribute lookup.
+_U16 = struct.Struct('>H').unpack_from
+_U32 = struct.Struct('>I').unpack_from
+_LINENUM = struct.Struct('>BHB').unpack_from
+_SEQPT = struct.Struct('>BHBH')
+
+# Matches a routine header line in Inform assembly output:
+#   LINENUM  +ADDR  [ FUNCNAME ...
+_ASM_ROUTINE_RE = re.compile(r'\s*(\d+)\s+\+([0-9a-fA-F]+)\s+\[\s+(\S+)')
 
 popt = optparse.OptionParser(usage='profile-analyze.py [options] profile-raw [ gameinfo.dbg | game.asm ]')
 
@@ -255,37 +269,52 @@ callcounts = None
 sourcemap = None
 
 class Function:
+    # There is one of these per profiled function, so we use slots
+    # rather than a per-instance dict.
+    __slots__ = (
+        'addr', 'hexaddr', 'name', 'special', 'linenum',
+        'call_count', 'accel_count', 'total_ops', 'total_time',
+        'self_ops', 'self_time', 'max_depth', 'max_stack_use',
+        'incalls', 'outcalls',
+    )
+    
     def __init__(self, addr, hexaddr, attrs):
         self.addr = addr
         self.hexaddr = hexaddr
-        val = special_functions.get(addr)
-        if (addr >= 0xF0000000):
+        # Nearly every function is an ordinary game function, so test
+        # for that before looking at the special interpreter ranges.
+        if (addr < 0xE0000000):
+            self.name = '<???>'
+            self.special = False
+        elif (addr >= 0xF0000000):
             name = glk_functions.get(addr-0xF0000000)
             if (not name):
-                name = hex(addr-0xF0000000)[2:]
-                name = '$' + name.replace('L', '')
+                name = '$' + hex(addr-0xF0000000)[2:]
             self.name = '<@glk_' + name + '>'
             self.special = True
-        elif (val is None):
-            self.name = '<???>'
-            self.special = False
         else:
-            self.name = '<@' + val + '>'
-            self.special = True
+            val = special_functions.get(addr)
+            if (val is None):
+                self.name = '<???>'
+                self.special = False
+            else:
+                self.name = '<@' + val + '>'
+                self.special = True
         self.linenum = 0
+        # attrs is a plain dict from expat. The required attributes are
+        # indexed directly; the optional ones go through a hoisted get().
+        get = attrs.get
         self.call_count  =  int(attrs['call_count'])
-        self.accel_count = 0
-        val = attrs.get('accel_count')
-        if (val):
-            self.accel_count   = int(val)
+        val = get('accel_count')
+        self.accel_count = int(val) if val else 0
         self.total_ops  =   int(attrs['total_ops'])
         self.total_time = float(attrs['total_time'])
         self.self_ops   =   int(attrs['self_ops'])
         self.self_time  = float(attrs['self_time'])
-        val = attrs.get('max_depth')
+        val = get('max_depth')
         if (val):
             self.max_depth     = int(val)
-        val = attrs.get('max_stack_use')
+        val = get('max_stack_use')
         if (val):
             self.max_stack_use = int(val)
         self.incalls = {}
@@ -344,26 +373,6 @@ class DispatchDumpHandler(xml.sax.handler.ContentHandler):
             addr = int(attrs['id'])
             glk_functions[addr] = str(attrs['name'])
         
-class ProfileRawHandler(xml.sax.handler.ContentHandler):
-    def startElement(self, name, attrs):
-        global functions, callcounts
-        
-        if (name == 'profile'):
-            functions = {}
-            callcounts = {}
-        if (name == 'function'):
-            hexaddr = attrs.get('addr')
-            addr = int(hexaddr, 16)
-            func = Function(addr, hexaddr, attrs)
-            functions[addr] = func
-        if (name == 'calls'):
-            hexaddr = attrs.get('fromaddr')
-            fromaddr = int(hexaddr, 16)
-            hexaddr = attrs.get('toaddr')
-            toaddr = int(hexaddr, 16)
-            count = int(attrs.get('count'))
-            callcounts[(fromaddr, toaddr)] = count
-
 class SFrameHandler:
     def __init__(self, tag, parent=None, depth=None, children={}, active=None, handler=None):
         self.tag = tag
@@ -423,7 +432,7 @@ class SimpleXMLFrame(xml.sax.handler.ContentHandler):
             frame.handler = parhan
             if parhan in (int, str):
                 frame.accumchar = []
-            elif parhan is ():
+            elif parhan == ():
                 taghan = self.taghandlers[name]
                 frame.handler = taghan
                 frame.children = taghan.children
@@ -549,7 +558,7 @@ class NewDebugArray:
         self.address = address
         self.bytecount = bytecount
         self.bytesperel = bytesperel
-        self.elcount = bytecount / bytesperel
+        self.elcount = bytecount // bytesperel
         if not sourceloc:
             sourceloc = 'compiler'
         self.sourceloc = sourceloc
@@ -654,32 +663,36 @@ class NewDebugHandler(SimpleXMLFrame):
                 fileref = srcfile
         return NewDebugSourceLoc(obj['line'], fileref)
 
-            
+def new_debug_linenum(func):
+    # The source line of a NewDebugFunction, or 0 if it has none.
+    if func.sourceloc and isinstance(func.sourceloc, NewDebugSourceLoc):
+        return func.sourceloc.line
+    return 0
+
 def parse_inform_assembly(fl):
     global sourcemap
-    sourcemap = {}
-    
+    table = {}
+
+    # A routine header is followed by a blank line; only then does
+    # it go into the sourcemap.
     lasttup = None
-    while True:
-        ln = fl.readline()
-        if (not ln):
-            break
-        ln = ln.strip()
-        ls = ln.split()
-        if (lasttup and not ls):
+    for ln in fl:
+        match = _ASM_ROUTINE_RE.match(ln)
+        if (match):
+            lasttup = (int(match.group(1)), sys.intern(match.group(3)), int(match.group(2), 16))
+            continue
+        if (lasttup and not ln.strip()):
             (linenum, funcname, addr) = lasttup
-            sourcemap[addr] = (linenum, funcname)
+            table[addr] = (linenum, funcname)
         lasttup = None
-        try:
-            if (len(ls) >= 4 and ls[2] == '[' and ls[1].startswith('+')):
-                linenum = int(ls[0])
-                funcname = ls[3]
-                addr = int(ls[1][1:], 16)
-                lasttup = (linenum, funcname, addr)
-        except ValueError:
-            pass
+    sourcemap = table
 
 class InformFunc:
+    __slots__ = (
+        'funcnum', 'name', 'addr', 'linenum', 'endaddr', 'endlinenum',
+        'locals', 'seqpts',
+    )
+    
     def __init__(self, funcnum):
         self.funcnum = funcnum
         self.name = '<???>'
@@ -696,7 +709,6 @@ class DebugFile:
     def __init__(self, fl):
         self.files = {}
         self.functions = {}
-        self.function_names = {}
         self.classes = []
         self.objects = {}
         self.arrays = {}
@@ -707,174 +719,206 @@ class DebugFile:
         self.fake_actions = {}
         self.map = {}
         self.header = None
+
+        # Rather than issuing lots of tiny reads, we map the file into
+        # memory and walk through it with an offset. Parsing starts
+        # wherever the file is currently positioned. If the file can't
+        # be mapped (say, it's a BinaryRangeIO) we read the rest of it
+        # into memory instead.
+        try:
+            self.buf = mmap.mmap(fl.fileno(), 0, access=mmap.ACCESS_READ)
+            self.off = fl.tell()
+        except (OSError, ValueError):
+            self.buf = fl.read()
+            self.off = 0
         
-        dat = fl.read(2)
-        val = unpack('>H', dat)[0]
+        val = self.read_short()
         if (val != 0xDEBF):
             raise ValueError('not an Inform debug file')
             
-        dat = fl.read(2)
-        self.debugversion = unpack('>H', dat)[0]
-        dat = fl.read(2)
-        self.informversion = unpack('>H', dat)[0]
-
-        rectable = {
-            1:  self.read_file_rec,
-            2:  self.read_class_rec,
-            3:  self.read_object_rec,
-            4:  self.read_global_rec,
-            5:  self.read_attr_rec,
-            6:  self.read_prop_rec,
-            7:  self.read_fake_action_rec,
-            8:  self.read_action_rec,
-            9:  self.read_header_rec,
-            10: self.read_lineref_rec,
-            11: self.read_routine_rec,
-            12: self.read_array_rec,
-            13: self.read_map_rec,
-            14: self.read_routine_end_rec,
-        }
-
+        self.debugversion = self.read_short()
+        self.informversion = self.read_short()
+
+        # Dispatch on the record type, testing the most common records
+        # (sequence points, routines, routine ends) first. Their
+        # handlers are hoisted into locals.
+        buf = self.buf
+        read_lineref_rec = self.read_lineref_rec
+        read_routine_rec = self.read_routine_rec
+        read_routine_end_rec = self.read_routine_end_rec
+        
         while True:
-            dat = fl.read(1)
-            rectype = unpack('>B', dat)[0]
-            if (rectype == 0):
+            rectype = buf[self.off]
+            self.off += 1
+            if (rectype == 10):
+                read_lineref_rec()
+            elif (rectype == 11):
+                read_routine_rec()
+            elif (rectype == 14):
+                read_routine_end_rec()
+            elif (rectype == 3):
+                self.read_object_rec()
+            elif (rectype == 6):
+                self.read_prop_rec()
+            elif (rectype == 5):
+                self.read_attr_rec()
+            elif (rectype == 12):
+                self.read_array_rec()
+            elif (rectype == 4):
+                self.read_global_rec()
+            elif (rectype == 8):
+                self.read_action_rec()
+            elif (rectype == 7):
+                self.read_fake_action_rec()
+            elif (rectype == 2):
+                self.read_class_rec()
+            elif (rectype == 1):
+                self.read_file_rec()
+            elif (rectype == 13):
+                self.read_map_rec()
+            elif (rectype == 9):
+                self.read_header_rec()
+            elif (rectype == 0):
                 break
-            recfunc = rectable.get(rectype)
-            if (not recfunc):
+            else:
                 raise ValueError('unknown debug record type: %d' % (rectype,))
-            recfunc(fl)
 
-        for func in self.functions.values():
-            self.function_names[func.name] = func
+        if (isinstance(self.buf, mmap.mmap)):
+            self.buf.close()
+        self.buf = None
+
+        self.function_names = { func.name: func for func in self.functions.values() }
 
-    def read_file_rec(self, fl):
-        dat = fl.read(1)
-        filenum = unpack('>B', dat)[0]
-        includename = self.read_string(fl)
-        realname = self.read_string(fl)
+    def read_file_rec(self):
+        filenum = self.read_byte()
+        includename = self.read_string()
+        realname = self.read_string()
         self.files[filenum] = ( includename, realname )
         
-    def read_class_rec(self, fl):
-        name = self.read_string(fl)
-        start = self.read_linenum(fl)
-        end = self.read_linenum(fl)
+    def read_class_rec(self):
+        name = self.read_string()
+        start = self.read_linenum()
+        end = self.read_linenum()
         self.classes.append( (name, start, end) )
         
-    def read_object_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
-        start = self.read_linenum(fl)
-        end = self.read_linenum(fl)
+    def read_object_rec(self):
+        num = self.read_short()
+        name = self.read_string()
+        start = self.read_linenum()
+        end = self.read_linenum()
         self.objects[num] = (name, start, end)
     
-    def read_global_rec(self, fl):
-        dat = fl.read(1)
-        num = unpack('>B', dat)[0]
-        name = self.read_string(fl)
+    def read_global_rec(self):
+        num = self.read_byte()
+        name = self.read_string()
         self.globals[num] = name
     
-    def read_array_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
+    def read_array_rec(self):
+        num = self.read_short()
+        name = self.read_string()
         self.arrays[num] = name
     
-    def read_attr_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
+    def read_attr_rec(self):
+        num = self.read_short()
+        name = self.read_string()
         self.attributes[num] = name
     
-    def read_prop_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
+    def read_prop_rec(self):
+        num = self.read_short()
+        name = self.read_string()
         self.properties[num] = name
     
-    def read_action_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
+    def read_action_rec(self):
+        num = self.read_short()
+        name = self.read_string()
         self.actions[num] = name
     
-    def read_fake_action_rec(self, fl):
-        dat = fl.read(2)
-        num = unpack('>H', dat)[0]
-        name = self.read_string(fl)
+    def read_fake_action_rec(self):
+        num = self.read_short()
+        name = self.read_string()
         self.fake_actions[num] = name
     
-    def read_routine_rec(self, fl):
-        dat = fl.read(2)
-        funcnum = unpack('>H', dat)[0]
+    def read_routine_rec(self):
+        funcnum = self.read_short()
         func = self.get_function(funcnum)
         
-        func.linenum = self.read_linenum(fl)
-        dat = fl.read(3)
-        addr = unpack('>I', b'\0'+dat)[0]
-        func.addr = int(addr)
-        func.name = self.read_string(fl)
+        func.linenum = self.read_linenum()
+        func.addr = self.read_addr()
+        func.name = self.read_string()
         locals = []
         while True:
-            val = self.read_string(fl)
+            val = self.read_string()
             if (not val):
                 break
             locals.append(val)
         func.locals = locals
 
-    def read_lineref_rec(self, fl):
-        dat = fl.read(2)
-        funcnum = unpack('>H', dat)[0]
+    def read_lineref_rec(self):
+        funcnum = self.read_short()
         func = self.get_function(funcnum)
 
         if (not func.seqpts):
             func.seqpts = []
         
-        dat = fl.read(2)
-        count = unpack('>H', dat)[0]
-        for ix in range(count):
-            linenum = self.read_linenum(fl)
-            dat = fl.read(2)
-            addr = unpack('>H', dat)[0]
-            func.seqpts.append( (linenum, addr) )
+        # The sequence points are a packed array of (linenum, addr)
+        # pairs, so we unpack the whole block in one go.
+        count = self.read_short()
+        end = self.off + count*_SEQPT.size
+        func.seqpts.extend([ ((filenum, linenum, charnum), addr)
+                             for (filenum, linenum, charnum, addr)
+                             in _SEQPT.iter_unpack(self.buf[self.off:end]) ])
+        self.off = end
         
-    def read_routine_end_rec(self, fl):
-        dat = fl.read(2)
-        funcnum = unpack('>H', dat)[0]
+    def read_routine_end_rec(self):
+        funcnum = self.read_short()
         func = self.get_function(funcnum)
 
-        func.endlinenum = self.read_linenum(fl)
-        dat = fl.read(3)
-        addr = unpack('>I', b'\0'+dat)[0]
-        func.endaddr = int(addr)
+        func.endlinenum = self.read_linenum()
+        func.endaddr = self.read_addr()
 
-    def read_header_rec(self, fl):
-        dat = fl.read(64)
-        self.header = dat
+    def read_header_rec(self):
+        self.header = self.buf[self.off:self.off+64]
+        self.off += 64
     
-    def read_map_rec(self, fl):
+    def read_map_rec(self):
         while True:
-            name = self.read_string(fl)
+            name = self.read_string()
             if (not name):
                 break
-            dat = fl.read(3)
-            addr = unpack('>I', b'\0'+dat)[0]
-            addr = int(addr)
+            addr = self.read_addr()
             self.map[name] = addr
+
+    def read_byte(self):
+        val = self.buf[self.off]
+        self.off += 1
+        return val
+
+    def read_short(self):
+        val = _U16(self.buf, self.off)[0]
+        self.off += 2
+        return val
+
+    def read_addr(self):
+        # Addresses are three bytes, big-endian.
+        off = self.off
+        val = (_U16(self.buf, off)[0] << 8) | self.buf[off+2]
+        self.off = off+3
+        return val
     
-    def read_linenum(self, fl):
-        dat = fl.read(4)
-        (funcnum, linenum, charnum) = unpack('>BHB', dat)
+    def read_linenum(self):
+        (funcnum, linenum, charnum) = _LINENUM(self.buf, self.off)
+        self.off += 4
         return (funcnum, linenum, charnum)
 
-    def read_string(self, fl):
-        val = b''
-        while True:
-            dat = fl.read(1)
-            if (dat == b'\0'):
-                return val.decode()
-            val += dat
+    def read_string(self):
+        # Nearly all strings in the debug file are identifiers, which
+        # end up as dict keys and repeat across tables, so we intern them.
+        end = self.buf.find(b'\0', self.off)
+        if (end < 0):
+            raise ValueError('unterminated string in debug file')
+        val = self.buf[self.off:end]
+        self.off = end+1
+        return sys.intern(val.decode())
 
     def get_function(self, funcnum):
         func = self.functions.get(funcnum)
@@ -919,8 +963,10 @@ def typestring(dat):
     return "'" + dat.decode() + "'"
 
 class BlorbChunk:
-    def __init__(self, formchunk, typ, start, len, formtype=None):
-        self.formchunk = formchunk
+    # The start offset is relative to the FORM chunk's data, which
+    # begins 8 bytes into the file.
+    def __init__(self, file, typ, start, len, formtype=None):
+        self.file = file
         self.type = typ
         self.start = start
         self.len = len
@@ -930,11 +976,11 @@ class BlorbChunk:
         return '<BlorbChunk %s at %d, len %d>' % (typestring(self.type), self.start, self.len)
     
     def data(self, max=None):
-        self.formchunk.seek(self.start)
+        self.file.seek(self.start+8)
         toread = self.len
         if (max is not None):
             toread = min(self.len, max)
-        return self.formchunk.read(toread)
+        return self.file.read(toread)
 
     def describe(self):
         if (not self.formtype):
@@ -942,48 +988,98 @@ class BlorbChunk:
         else:
             return '%s/%s (%d+8 bytes, start %d)' % (typestring(self.type), typestring(self.formtype), self.len, self.start)
 
-def blorb_find_debug_chunk(filename):
-    file = open(filename, 'rb')
-    formchunk = Chunk(file)
-    formchunk = formchunk
-
-    if (formchunk.getname() != b'FORM'):
+def blorb_find_debug_chunk(file):
+    # The file must be open (in binary mode) and positioned at the start.
+    dat = file.read(12)
+    if (dat[0:4] != b'FORM'):
         raise Exception('This does not appear to be a Blorb file.')
-    formtype = formchunk.read(4)
+    formtype = dat[8:12]
     if (formtype != b'IFRS'):
         raise Exception('This does not appear to be a Blorb file.')
 
     chunks = []
     debugchunk = None
     
-    formlen = formchunk.getsize()
-    while formchunk.tell() < formlen:
-        chunk = Chunk(formchunk)
-        start = formchunk.tell()
-        size = chunk.getsize()
+    formlen = _U32(dat, 4)[0]
+    pos = 4
+    while pos < formlen:
+        file.seek(pos+8)
+        dat = file.read(8)
+        if (len(dat) < 8):
+            raise EOFError()
+        typ = dat[0:4]
+        size = _U32(dat, 4)[0]
+        start = pos+8
         formtype = None
-        if chunk.getname() == b'FORM':
-            formtype = chunk.read(4)
-        subchunk = BlorbChunk(formchunk, chunk.getname(), start, size, formtype)
+        if typ == b'FORM':
+            formtype = file.read(4)
+        subchunk = BlorbChunk(file, typ, start, size, formtype)
         chunks.append(subchunk)
-        chunk.skip()
-        chunk.close()
+        # Chunks are padded to an even length.
+        pos = start + size + (size & 1)
 
     for chunk in chunks:
         if (chunk.type == b'Dbug'):
             debugchunk = chunk
 
-    formchunk.close()
-    file.close()
-    file = None
-
     return debugchunk
 
+class ProfileRawDone(Exception):
+    # Raised to stop parsing once the <profile> element is closed.
+    pass
+
+def parse_profile_raw(filename):
+    # Fills out the functions and callcounts globals. We drive expat
+    # directly (rather than going through xml.sax) because profile-raw
+    # files can contain a great many <function> elements. Anything after
+    # the closing </profile> tag is not parsed. (Reading stops at the end
+    # of the 64K block containing it.)
+    global functions, callcounts
+
+    # The tables are filled in as closure locals and only published
+    # as globals at the end, so the per-element inserts don't go
+    # through the module dict.
+    funcs = {}
+    calls = {}
+    
+    def start_element(name, attrs):
+        if (name == 'function'):
+            hexaddr = attrs['addr']
+            addr = int(hexaddr, 16)
+            funcs[addr] = Function(addr, hexaddr, attrs)
+        elif (name == 'calls'):
+            fromaddr = int(attrs['fromaddr'], 16)
+            toaddr = int(attrs['toaddr'], 16)
+            calls[(fromaddr, toaddr)] = int(attrs['count'])
+        elif (name == 'profile'):
+            funcs.clear()
+            calls.clear()
+
+    def end_element(name):
+        if (name == 'profile'):
+            raise ProfileRawDone()
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    fl = open(filename, 'rb')
+    try:
+        while True:
+            dat = fl.read(65536)
+            if (not dat):
+                break
+            parser.Parse(dat, False)
+        parser.Parse(b'', True)
+    except ProfileRawDone:
+        pass
+    fl.close()
+
+    functions = funcs
+    callcounts = calls
     
 def list_by(key='self_time', limit=10):
-    ls = functions.values()
-    ls.sort(lambda x1, x2: cmp(getattr(x2, key), getattr(x1, key)))
-    for func in ls[:limit]:
+    ls = heapq.nlargest(limit, functions.values(), key=operator.attrgetter(key))
+    for func in ls:
         func.dump()
 
 # Read in the various files
@@ -994,82 +1090,71 @@ if (opts.dispatchfile):
 
 if (profile_raw):
     # Fills out the functions global
-    xml.sax.parse(profile_raw, ProfileRawHandler())
+    parse_profile_raw(profile_raw)
 
 need_function_address_offset = False
 
 if (game_file_data):
-    # Fill out the sourcemap global, by one of various methods
+    # Fill out the sourcemap global, by one of various methods. We open
+    # the file once, peek at the first two bytes, and pass the same file
+    # on to whichever parser applies.
     fl = open(game_file_data, 'rb')
     val = fl.read(2)
-    fl.close()
+    fl.seek(0)
     if (not val):
         pass
     elif (val == b'\xde\xbf'):
         # Old-style Inform debug info.
         need_function_address_offset = True
-        fl = open(game_file_data, 'rb')
         debugfile = DebugFile(fl)
-        fl.close()
-        sourcemap = {}
-        for func in debugfile.functions.values():
-            sourcemap[func.addr] = ( func.linenum[1], func.name )
+        sourcemap = { func.addr: (func.linenum[1], func.name)
+                      for func in debugfile.functions.values() }
     elif (val == b'<?'):
         # New-style Inform debug info.
         han = NewDebugHandler()
-        xml.sax.parse(game_file_data, han)
+        xml.sax.parse(fl, han)
         debugfile = han.debugfile()
-        sourcemap = {}
-        for func in debugfile.functions:
-            linenum = 0
-            if func.sourceloc and isinstance(func.sourceloc, NewDebugSourceLoc):
-                linenum = func.sourceloc.line
-            sourcemap[func.address] = ( linenum, func.id )
+        sourcemap = { func.address: (new_debug_linenum(func), func.id)
+                      for func in debugfile.functions }
     elif (val == b'\x46\x4F'):
         # Looks like a Blorb file. Scan for a Dbug chunk.
-        debugchunk = blorb_find_debug_chunk(game_file_data)
+        debugchunk = blorb_find_debug_chunk(fl)
         if not debugchunk:
             raise Exception('This Blorb file has no Dbug chunk.')
         # Now we check the contents, which means repeating a
         # bunch of the above code.
-        fl = open(game_file_data, 'rb')
         fl.seek(debugchunk.start+8)
         val = fl.read(2)
         if (val == b'\xde\xbf'):
             need_function_address_offset = True
             subfl = BinaryRangeIO(fl, debugchunk.start+8, debugchunk.len)
-            debugfile = DebugFile(fl)
+            debugfile = DebugFile(subfl)
             subfl.close()
-            sourcemap = {}
-            for func in debugfile.functions.values():
-                sourcemap[func.addr] = ( func.linenum[1], func.name )
+            sourcemap = { func.addr: (func.linenum[1], func.name)
+                          for func in debugfile.functions.values() }
         elif (val == b'<?'):
             subfl = BinaryRangeIO(fl, debugchunk.start+8, debugchunk.len)
             han = NewDebugHandler()
             xml.sax.parse(subfl, han)
             subfl.close()
             debugfile = han.debugfile()
-            sourcemap = {}
-            for func in debugfile.functions:
-                linenum = 0
-                if func.sourceloc and isinstance(func.sourceloc, NewDebugSourceLoc):
-                    linenum = func.sourceloc.line
-                sourcemap[func.address] = ( linenum, func.id )
+            sourcemap = { func.address: (new_debug_linenum(func), func.id)
+                          for func in debugfile.functions }
         else:
             raise Exception('Blorb Dbug chunk was not recognized.')
-        fl.close()
     else:
-        # Assume it's an Inform assembly dump.
+        # Assume it's an Inform assembly dump. This is text, read with
+        # universal newlines.
         need_function_address_offset = True
-        fl = open(game_file_data, 'rU')
+        fl = io.TextIOWrapper(fl)
         parse_inform_assembly(fl)
-        fl.close()
+    fl.close()
 
 if (profile_raw):
     # If there is profile data, display it.
     
-    source_start = min([ func.addr for func in functions.values()
-        if not func.special ])
+    source_start = min(func.addr for func in functions.values()
+        if not func.special)
 
     # For old debug formats, all the function addresses are relative to
     # the start of function memory. For the new format, they're all
@@ -1110,21 +1195,20 @@ if (profile_raw):
             if (badls):
                 print(len(badls), 'functions from', profile_raw, 'did not appear in asm (veneer functions)')
         
-        function_names = {}
-        for func in functions.values():
-            function_names[func.name] = func
+        function_names = { func.name: func for func in functions.values() }
     
-    if (sourcemap):
-        uncalled_funcs = [ funcname for (addr, (linenum, funcname)) in sourcemap.items() if (addr+function_address_offset) not in functions ]
-        if (not opts.dumbfrotz):
-            print(len(uncalled_funcs), 'functions found in', game_file_data, 'were never called')
+    if (sourcemap and not opts.dumbfrotz):
+        # We only need the count, so take a set difference of addresses
+        # rather than building a list of names.
+        called = { addr-function_address_offset for addr in functions }
+        uncalled_count = len(sourcemap.keys() - called)
+        print(uncalled_count, 'functions found in', game_file_data, 'were never called')
     
     if (opts.dumbfrotz):
-        ls = functions.values()
-        ls.sort(lambda x1, x2: cmp(x2.total_ops, x1.total_ops))
+        ls = sorted(functions.values(), key=operator.attrgetter('total_ops'), reverse=True)
         ops_executed = 0
         routine_calls = 0
-        max_stack_use = max([func.max_stack_use for func in ls])
+        max_stack_use = max(func.max_stack_use for func in ls)
         for func in ls:
             if (func.total_ops > ops_executed):
                 ops_executed = func.total_ops
@@ -1138,20 +1222,20 @@ if (profile_raw):
             func.dump_dumbfrotz_style()
     else:
         print('Functions that consumed the most time (excluding children):')
-        ls = list(functions.values())
         
-        sortfunc = lambda fn:-fn.self_time
+        sortkey = 'self_time'
         if (opts.listsort in ('self_time', 'self-time', 'selftime')):
-            sortfunc = lambda fn:-fn.self_time
+            sortkey = 'self_time'
         elif (opts.listsort in ('self_ops', 'self-ops', 'selfops')):
-            sortfunc = lambda fn:-fn.self_ops
+            sortkey = 'self_ops'
         elif (opts.listsort in ('total_time', 'total-time', 'totaltime')):
-            sortfunc = lambda fn:-fn.total_time
+            sortkey = 'total_time'
         elif (opts.listsort in ('total_ops', 'total-ops', 'totalops')):
-            sortfunc = lambda fn:-fn.total_ops
+            sortkey = 'total_ops'
         elif (opts.listsort in ('call_count', 'call-count', 'callcount')):
-            sortfunc = lambda fn:-fn.call_count
-            
-        ls.sort(key=sortfunc)
-        for func in ls[0 : opts.listcount]:
+            sortkey = 'call_count'
+
+        # We only want the top few, so there's no need to sort the lot.
+        ls = heapq.nlargest(opts.listcount, functions.values(), key=operator.attrgetter(sortkey))
+        for func in ls:
             func.dump()